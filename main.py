@@ -1,14 +1,25 @@
 import os
+import io
 import logging
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Deque, Awaitable
 from pathlib import Path
 import tempfile
 from datetime import datetime
+from dataclasses import dataclass, field
 import asyncio
+import functools
+import itertools
+import json
+import re
+from collections import OrderedDict, deque
 
+import httpx
 from telegram import Update, InputFile
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
+    CallbackContext,
     CommandHandler,
     MessageHandler,
     filters,
@@ -25,163 +36,299 @@ logger = logging.getLogger(__name__)
 TOKEN = "xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
 ADMIN_UID = xxxxxxxxxx  # Only respond to this user ID
 TARGET_GROUP_ID = xxxxxxxxxxx  # Group to send videos to
+PUBLIC_URL = os.environ.get("PUBLIC_URL")  # HTTPS base URL Telegram posts updates to, polling when unset
 MAX_VIDEO_SIZE = 49 * 1024 * 1024  # 49MB (Telegram file size limit for bots)
 TEMP_DIR = Path(tempfile.gettempdir()) / "telegram_video_bot"
 TEMP_DIR.mkdir(exist_ok=True, parents=True)
+_export_seq = itertools.count(1)  # Numbers the exported link files
+_job_seq = itertools.count(1)  # Numbers downloads, links of the same video never share a file
+BATCH_LOG = TEMP_DIR / "batch.jsonl"  # Queued and finished links, replayed by /resume
+_URL_OK = re.compile(r'^https?://').match  # Links the bot will queue
+FRAGMENT_DOWNLOADS = 8  # Parallel fragment requests per HLS/DASH download
+MAX_CONCURRENT_DOWNLOADS = 2  # Videos downloaded in parallel, keeps open sockets around 16
+PREFETCH_LIMIT = 4  # Links queued ahead of the uploader
+SEEN_LINKS_LIMIT = 10_000  # Recent links remembered for duplicate checks
+TELEGRAM_RATE_LIMIT = 25  # Bot API calls per second, Telegram allows about 30
+STATUS_UPDATE_INTERVAL = 1.5  # Seconds between status message edits
+
+@dataclass(slots=True)
+class CaptionSettings:
+    active: bool = False
+    remaining: int = 0
+    text: Optional[str] = None
+
+@dataclass(slots=True)
+class BatchState:
+    """Remaining links and status messages of the current batch."""
+    all_links: List[str] = field(default_factory=list)
+    total: int = 0  # len(all_links), kept up to date by add_links_to_queue
+    processed: int = 0
+    failed: List[str] = field(default_factory=list)
+    remaining: Deque[str] = field(default_factory=deque)
+    seen_links: OrderedDict[str, None] = field(default_factory=OrderedDict)  # Recently queued links, oldest dropped first
+    start_time: Optional[datetime] = None
+    user_id: Optional[int] = None
+    last_processed_link: Optional[str] = None
+    status_message_id: Optional[int] = None  # To track the status message for updates
+    last_auto_send: int = 0  # Track when we last sent the auto remain file
+    caption_settings: CaptionSettings = field(default_factory=CaptionSettings)
+
+    def reset(self, **fields) -> None:
+        """Restore every field to its default, then apply the given values."""
+        self.__init__(**fields)
 
 # Global variable to store remaining links and status messages
-current_batch = {
-    'all_links': [],
-    'processed': 0,
-    'failed': [],
-    'remaining': [],
-    'start_time': None,
-    'user_id': None,
-    'last_processed_link': None,
-    'is_processing': False,
-    'is_paused': False,
-    'status_message_id': None,  # To track the status message for updates
-    'last_auto_send': 0,  # Track when we last sent the auto remain file
-    'caption_settings': {
-        'active': False,
-        'remaining': 0,
-        'text': None
-    }
-}
+current_batch = BatchState()
 
 class VideoDownloader:
-    @staticmethod
-    async def check_video_size(url: str) -> bool:
-        """Check if video size exceeds limit before downloading."""
+    """Downloads videos through a yt-dlp instance that is reused across links."""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()  # YoutubeDL isn't safe to use from two threads at once
         try:
             from yt_dlp import YoutubeDL
-            
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': True,
-            }
-            
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if info and 'filesize' in info:
-                    return info['filesize'] <= MAX_VIDEO_SIZE
-                return True  # Proceed if size can't be determined
-        except Exception as e:
-            logger.warning(f"Couldn't check video size: {e}")
-            return True  # Proceed if check fails
+        except ImportError:
+            logger.warning("yt-dlp not available, falling back to pytube")
+            self._ydl = None
+            return
+        
+        ydl_opts = {
+            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+            'outtmpl': str(TEMP_DIR / '%(job)s_%(id)s.%(ext)s'),  # job comes from extract_info's extra_info
+            'quiet': True,
+            'no_warnings': True,
+            'merge_output_format': 'mp4',
+            'max_filesize': MAX_VIDEO_SIZE,
+            'concurrent_fragment_downloads': FRAGMENT_DOWNLOADS,
+            'http_chunk_size': 10 * 1024 * 1024,
+            'retries': 3,
+            'fragment_retries': 5,
+            'throttledratelimit': 100_000,  # Re-extract if the origin throttles below 100KB/s
+            'updatetime': False,  # Keep the real write time as mtime, not the server's Last-Modified
+            # max_filesize only covers plain HTTP downloads, this also skips
+            # fragmented formats whose (approximate) size is known up front
+            'match_filter': self._reject_oversized,
+        }
+        self._ydl = YoutubeDL(ydl_opts)
 
     @staticmethod
-    async def get_highest_quality_video(url: str) -> Optional[Path]:
-        """Download the highest quality video from the provided URL."""
-        try:
-            # First check video size
-            if not await VideoDownloader.check_video_size(url):
-                logger.info(f"Video exceeds size limit: {url}")
-                return None
+    def _reject_oversized(info: Dict, *, incomplete: bool = False) -> Optional[str]:
+        """yt-dlp match_filter that skips videos of the selected format over MAX_VIDEO_SIZE."""
+        filesize = info.get('filesize') or info.get('filesize_approx')
+        if filesize and filesize > MAX_VIDEO_SIZE:
+            logger.info("Video exceeds size limit (%s bytes): %s", filesize, info.get('webpage_url'))
+            return "Video exceeds size limit"
+        return None
 
-            # Try youtube-dlp first
-            try:
-                from yt_dlp import YoutubeDL
-                
-                ydl_opts = {
-                    'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-                    'outtmpl': str(TEMP_DIR / '%(id)s.%(ext)s'),
-                    'quiet': True,
-                    'no_warnings': True,
-                    'merge_output_format': 'mp4',
-                    'max_filesize': MAX_VIDEO_SIZE,
-                }
-                
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    if info:
-                        filename = ydl.prepare_filename(info)
-                        downloaded_file = Path(filename)
-                        
-                        # Double-check file size after download
-                        if downloaded_file.stat().st_size > MAX_VIDEO_SIZE:
-                            os.unlink(downloaded_file)
-                            return None
-                        return downloaded_file
-            except ImportError:
-                logger.warning("yt-dlp not available, trying pytube")
-                
-                # Fallback to pytube for YouTube links
-                from pytube import YouTube
-                if "youtube.com" in url or "youtu.be" in url:
-                    yt = YouTube(url)
-                    stream = yt.streams.filter(
-                        progressive=True, 
-                        file_extension='mp4'
-                    ).order_by('resolution').desc().first()
-                    
-                    if stream:
-                        # Check size before downloading
-                        if stream.filesize > MAX_VIDEO_SIZE:
-                            return None
-                            
-                        output_path = str(TEMP_DIR / f"{yt.video_id}.mp4")
-                        stream.download(output_path=output_path)
-                        downloaded_file = Path(output_path) / stream.default_filename
-                        
-                        # Final size check
-                        if downloaded_file.stat().st_size > MAX_VIDEO_SIZE:
-                            os.unlink(downloaded_file)
-                            return None
-                        return downloaded_file
-            
+    def _download_sync(self, url: str, job: int) -> Optional[Path]:
+        """Blocking part of get_highest_quality_video, run in a worker thread."""
+        if self._ydl is not None:
+            # Most oversized videos are skipped by yt-dlp itself, leaving no file behind
+            info = self._ydl.extract_info(url, download=True, extra_info={'job': job})
+            if info:
+                downloaded_file = Path(self._ydl.prepare_filename(info))
+                if downloaded_file.exists():
+                    # HLS/DASH streams of unknown size get past max_filesize and match_filter
+                    if downloaded_file.stat().st_size > MAX_VIDEO_SIZE:
+                        downloaded_file.unlink()
+                        return None
+                    return downloaded_file
             return None
+        
+        # Fallback to pytube for YouTube links
+        from pytube import YouTube
+        if "youtube.com" in url or "youtu.be" in url:
+            yt = YouTube(url)
+            stream = yt.streams.filter(
+                progressive=True, 
+                file_extension='mp4'
+            ).order_by('resolution').desc().first()
+            
+            if stream:
+                # Check size before downloading
+                if stream.filesize > MAX_VIDEO_SIZE:
+                    return None
+                    
+                output_path = str(TEMP_DIR / f"{job}_{yt.video_id}")
+                stream.download(output_path=output_path)
+                downloaded_file = Path(output_path) / stream.default_filename
+                
+                # Final size check
+                if downloaded_file.stat().st_size > MAX_VIDEO_SIZE:
+                    os.unlink(downloaded_file)
+                    return None
+                return downloaded_file
+        
+        return None
+
+    async def get_highest_quality_video(self, url: str) -> Optional[Path]:
+        """Download the highest quality video from the provided URL."""
+        try:
+            # yt-dlp/pytube block until the download finishes, so keep them off the event loop.
+            # Cancelling us doesn't stop the thread, so the lock is only released once it returns.
+            await self._lock.acquire()
+            thread = asyncio.ensure_future(asyncio.to_thread(self._download_sync, url, next(_job_seq)))
+            thread.add_done_callback(self._thread_done)
+            return await asyncio.shield(thread)
         except Exception as e:
-            logger.error(f"Error downloading video: {e}")
+            logger.error("Error downloading video: %s", e)
             return None
 
+    def _thread_done(self, thread: asyncio.Future) -> None:
+        self._lock.release()
+        if not thread.cancelled():
+            thread.exception()  # Mark it retrieved, a cancelled caller never awaits it
+
+class RateLimiter:
+    """Allows at most `rate` calls in any one-second window."""
+
+    def __init__(self, rate: int):
+        self._tokens = asyncio.Semaphore(rate)
+
+    async def acquire(self) -> None:
+        await self._tokens.acquire()
+        # Hand the token back once it has aged out of the window
+        asyncio.get_running_loop().call_later(1, self._tokens.release)
+
 class TelegramBot:
     def __init__(self, token: str):
-        self.application = Application.builder().token(token).build()
+        # Keep connections open so status edits don't queue behind running uploads,
+        # HTTP/2 multiplexes concurrent calls over a single TLS connection
+        request = HTTPXRequest(
+            connection_pool_size=16,
+            connect_timeout=20,
+            read_timeout=120,
+            write_timeout=120,
+            pool_timeout=30,
+            http_version="2",
+        )
+        self.application = (
+            Application.builder()
+            .token(token)
+            .request(request)
+            .get_updates_request(HTTPXRequest(connection_pool_size=1))
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+            .build()
+        )
         self._setup_handlers()
-        self.processing_task = None
+        # Lists of links waiting for the feeder, the workers started in _post_init drain it
+        self.link_q: asyncio.Queue = asyncio.Queue()
+        # Held while current_batch and link_q are updated together
+        self.batch_lock = asyncio.Lock()
+        self._workers: List[asyncio.Task] = []
+        self._context = None
+        self.downloaders = [VideoDownloader() for _ in range(MAX_CONCURRENT_DOWNLOADS)]
+        # Downloaders not running a thread, a dropped download keeps its own until the thread returns
+        self._idle_downloaders: asyncio.Queue = asyncio.Queue()
+        for downloader in self.downloaders:
+            self._idle_downloaders.put_nowait(downloader)
+        # Links handed to the download workers whose upload hasn't started yet
+        self._dispatched: Dict[str, asyncio.Future] = {}
+        # Finished downloads of links that were still queued when the workers stopped
+        self._prefetched: Dict[str, Path] = {}
+        # Caps parallel downloads for the bot's lifetime, a slot is only freed once its
+        # download thread returns, so dropped downloads still count after a worker restart
+        self.dl_sem = asyncio.BoundedSemaphore(MAX_CONCURRENT_DOWNLOADS)
+        self.rate_limiter = RateLimiter(TELEGRAM_RATE_LIMIT)
+        # Latest status text waiting for the status writer
+        self._status_text: Optional[str] = None
+        self._status_dirty = asyncio.Event()
+        self._status_lock = asyncio.Lock()
+        # Cleared while paused, the pipeline waits on it between links
+        self.pause_event = asyncio.Event()
+        self.pause_event.set()
+        # Files waiting to be deleted by the janitor
+        self._gc_q: asyncio.Queue = asyncio.Queue()
+        self._janitor_task = None
+        # Unfinished links in the batch log of a previous run, until /resume or /clean handles them
+        self._saved_links = 0
 
     def _setup_handlers(self):
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("help", self.help))
-        self.application.add_handler(CommandHandler("remain", self.show_remain))
-        self.application.add_handler(CommandHandler("stopnow", self.pause_processing))
-        self.application.add_handler(CommandHandler("startnow", self.resume_processing))
-        self.application.add_handler(CommandHandler("clean", self.clear_queue))
-        self.application.add_handler(CommandHandler("skip", self.skip_links))
-        self.application.add_handler(CommandHandler("cap", self.set_caption))
+        # Only respond to the admin, other users' updates are dropped before any handler runs
+        admin_filter = filters.User(user_id=ADMIN_UID)
+        self.application.add_handler(CommandHandler("start", self.start, filters=admin_filter))
+        self.application.add_handler(CommandHandler("help", self.help, filters=admin_filter))
+        self.application.add_handler(CommandHandler("remain", self.show_remain, filters=admin_filter))
+        self.application.add_handler(CommandHandler("stopnow", self.pause_processing, filters=admin_filter))
+        self.application.add_handler(CommandHandler("startnow", self.resume_processing, filters=admin_filter))
+        self.application.add_handler(CommandHandler("clean", self.clear_queue, filters=admin_filter))
+        self.application.add_handler(CommandHandler("skip", self.skip_links, filters=admin_filter))
+        self.application.add_handler(CommandHandler("cap", self.set_caption, filters=admin_filter))
+        self.application.add_handler(CommandHandler("resume", self.resume_batch, filters=admin_filter))
         self.application.add_handler(MessageHandler(
-            filters.TEXT | filters.Document.TXT, 
+            (filters.TEXT | filters.Document.TXT) & admin_filter, 
             self.handle_message
         ))
 
-    async def is_admin(self, update: Update) -> bool:
-        """Check if the message is from the admin."""
-        return update.effective_user.id == ADMIN_UID
+    async def _tg_call(self, coro_factory, tries: int = 5, idempotent: bool = True):
+        """Make a Bot API call within the rate limit, retrying flood control and network errors.
+
+        Calls that post something (idempotent=False) are only retried after network
+        errors that happened before the request reached Telegram, otherwise a timeout
+        after the upload went through would post it twice.
+        """
+        for attempt in range(tries):
+            await self.rate_limiter.acquire()
+            try:
+                return await coro_factory()
+            except RetryAfter as e:
+                if attempt == tries - 1:
+                    raise
+                logger.warning("Flood control exceeded, retrying in %ss", e.retry_after)
+                await asyncio.sleep(e.retry_after + 0.5)
+            except BadRequest:
+                raise  # Sending the same request again won't help
+            except NetworkError as e:  # Includes TimedOut
+                if attempt == tries - 1 or not (idempotent or self._not_sent(e)):
+                    raise
+                logger.warning("Telegram request failed (%s), retrying in %ss", e, 2 ** attempt)
+                await asyncio.sleep(2 ** attempt)
+
+    @staticmethod
+    def _not_sent(error: NetworkError) -> bool:
+        """Whether the request failed before any of it was sent to Telegram."""
+        return isinstance(error.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
 
     async def update_status_message(self, context: ContextTypes.DEFAULT_TYPE, status_text: str) -> None:
         """Update or send the status message."""
         try:
-            if current_batch['status_message_id']:
-                await context.bot.edit_message_text(
-                    chat_id=current_batch['user_id'],
-                    message_id=current_batch['status_message_id'],
+            if current_batch.status_message_id:
+                await self._tg_call(lambda: context.bot.edit_message_text(
+                    chat_id=current_batch.user_id,
+                    message_id=current_batch.status_message_id,
                     text=status_text
-                )
+                ))
             else:
-                message = await context.bot.send_message(
-                    chat_id=current_batch['user_id'],
+                message = await self._tg_call(lambda: context.bot.send_message(
+                    chat_id=current_batch.user_id,
                     text=status_text
-                )
-                current_batch['status_message_id'] = message.message_id
+                ))
+                current_batch.status_message_id = message.message_id
         except Exception as e:
-            logger.error(f"Error updating status message: {e}")
+            logger.error("Error updating status message: %s", e)
+
+    def schedule_status_update(self, status_text: str) -> None:
+        """Queue a new status text, only the latest one is sent by the status writer."""
+        self._status_text = status_text
+        self._status_dirty.set()
+
+    async def _status_writer(self, context: ContextTypes.DEFAULT_TYPE):
+        """Edit the status message at most once per STATUS_UPDATE_INTERVAL."""
+        while True:
+            await self._status_dirty.wait()
+            # Let the status settle so several transitions collapse into one edit
+            await asyncio.sleep(STATUS_UPDATE_INTERVAL)
+            async with self._status_lock:
+                self._status_dirty.clear()
+                status_text, self._status_text = self._status_text, None
+                if status_text:
+                    await self.update_status_message(context, status_text)
 
     async def send_completion_notification(self, context: ContextTypes.DEFAULT_TYPE, url: str, success: bool, error_msg: str = "") -> None:
         """Send notification when a link is fully processed."""
-        processed = current_batch['processed']
-        total = len(current_batch['all_links'])
+        processed = current_batch.processed
+        total = current_batch.total
         remain = total - processed
         
         status_emoji = "✅" if success else "❌"
@@ -196,26 +343,42 @@ class TelegramBot:
         )
         
         try:
-            # Send new completion message
-            await context.bot.send_message(
-                chat_id=current_batch['user_id'],
-                text=completion_text
-            )
-            
-            # Clear the status message ID to start fresh for next link
-            current_batch['status_message_id'] = None
+            async with self._status_lock:
+                # Pending status edits for this link are superseded by the completion message
+                self._status_text = None
+                self._status_dirty.clear()
+                
+                # Turn the live status message into the completion message
+                sent = False
+                if current_batch.status_message_id:
+                    try:
+                        await self._tg_call(lambda: context.bot.edit_message_text(
+                            chat_id=current_batch.user_id,
+                            message_id=current_batch.status_message_id,
+                            text=completion_text
+                        ))
+                        sent = True
+                    except BadRequest as e:
+                        # Status message deleted or not editable anymore
+                        logger.warning("Could not edit status message, sending a new one: %s", e)
+                
+                if not sent:
+                    await self._tg_call(lambda: context.bot.send_message(
+                        chat_id=current_batch.user_id,
+                        text=completion_text
+                    ))
+                
+                # Clear the status message ID to start fresh for next link
+                current_batch.status_message_id = None
             
             # Check if we should send remaining links after every 5 processed links
             if processed > 0 and processed % 5 == 0:
                 await self.send_remain_links(context)
         except Exception as e:
-            logger.error(f"Error sending completion notification: {e}")
+            logger.error("Error sending completion notification: %s", e)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send welcome message when command /start is issued."""
-        if not await self.is_admin(update):
-            return
-            
         welcome_text = """
 🤖 Welcome to Video Downloader Bot!
 
@@ -231,17 +394,15 @@ Commands:
 /remain - Get remaining links as text file
 /stopnow - Pause processing
 /startnow - Resume processing
-/clean - Clear all queued links
+/clean - Clear all queued links or the saved batch
 /skip N - Skip N links from current batch
 /cap N <Caption> - Add caption to next N videos
+/resume - Restore the batch saved before a restart
 """
         await update.message.reply_text(welcome_text)
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send help message when command /help is issued."""
-        if not await self.is_admin(update):
-            return
-            
         help_text = """
 📋 Admin Commands:
 
@@ -250,9 +411,10 @@ Commands:
 /remain - Get remaining links as text file
 /stopnow - Pause processing
 /startnow - Resume processing
-/clean - Clear all queued links
+/clean - Clear all queued links or the saved batch
 /skip N - Skip N links from current batch
 /cap N <Caption> - Add caption to next N videos
+/resume - Restore the batch saved before a restart
 
 How to use:
 1. Send a single video URL to download
@@ -264,9 +426,6 @@ How to use:
 
     async def set_caption(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Set a caption for the next N videos with /cap N <Caption Here> command."""
-        if not await self.is_admin(update):
-            return
-        
         if not context.args or len(context.args) < 2 or not context.args[0].isdigit():
             await update.message.reply_text(
                 "Usage: /cap N <Caption Here>\n"
@@ -282,11 +441,7 @@ How to use:
         
         caption_text = ' '.join(context.args[1:])
         
-        current_batch['caption_settings'] = {
-            'active': True,
-            'remaining': count,
-            'text': caption_text
-        }
+        current_batch.caption_settings = CaptionSettings(active=True, remaining=count, text=caption_text)
         
         await update.message.reply_text(
             f"📝 Caption set for next {count} videos:\n"
@@ -296,9 +451,6 @@ How to use:
 
     async def skip_links(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Skip N links from current batch with /skip N command."""
-        if not await self.is_admin(update):
-            return
-        
         if not context.args or not context.args[0].isdigit():
             await update.message.reply_text("Usage: /skip N (where N is number of links to skip)")
             return
@@ -308,458 +460,603 @@ How to use:
             await update.message.reply_text("Please provide a positive number of links to skip.")
             return
         
-        if not current_batch['is_processing']:
+        if not current_batch.remaining:
             await update.message.reply_text("No batch processing in progress to skip links from.")
             return
         
-        if skip_count >= len(current_batch['remaining']):
-            await update.message.reply_text(f"Skip count {skip_count} is greater than remaining links ({len(current_batch['remaining'])}). Cancelling batch.")
+        if skip_count >= len(current_batch.remaining):
+            await update.message.reply_text(f"Skip count {skip_count} is greater than remaining links ({len(current_batch.remaining)}). Cancelling batch.")
             await self.clear_queue(update, context)
             return
         
-        # Cancel current processing task
-        if self.processing_task and not self.processing_task.done():
-            self.processing_task.cancel()
-            try:
-                await self.processing_task
-            except asyncio.CancelledError:
-                pass
-        
-        # Skip N links
-        skipped_links = current_batch['remaining'][:skip_count]
-        current_batch['remaining'] = current_batch['remaining'][skip_count:]
-        current_batch['processed'] += skip_count
+        # Stop the workers first, an upload finishing meanwhile would pop a link we keep
+        await self._stop_workers()
+        try:
+            # Skip N links
+            skipped_links = [current_batch.remaining.popleft() for _ in range(skip_count)]
+            current_batch.processed += skip_count
+            async with self.batch_lock:
+                await self.log_links('skipped', skipped_links)
+        finally:
+            # Start over with the remaining links, downloads of the skipped ones are dropped
+            self._requeue_workers()
         
-        # Create skipped links file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        skipped_file = TEMP_DIR / f"skipped_links_{skip_count}_{timestamp}.txt"
-        with open(skipped_file, 'w') as f:
-            f.write('\n'.join(skipped_links))
+        # Build skipped links file in memory
+        skipped_file = io.BytesIO('\n'.join(skipped_links).encode())
         
         # Send the file
-        with open(skipped_file, 'rb') as f:
-            await update.message.reply_document(
-                document=InputFile(f),
-                caption=f"⏭️ Skipped {skip_count} links!\n"
-                       f"📊 New progress: {current_batch['processed']}/{len(current_batch['all_links'])}\n"
-                       f"⏳ Remaining: {len(current_batch['remaining'])}",
-            )
-        
-        # Clean up
-        os.unlink(skipped_file)
-        
-        # Restart processing with remaining links
-        current_batch['is_processing'] = True
-        self.processing_task = asyncio.create_task(self.process_batch(context))
+        await update.message.reply_document(
+            document=InputFile(skipped_file, filename=f"skipped_links_{skip_count}_{next(_export_seq)}.txt"),
+            caption=f"⏭️ Skipped {skip_count} links!\n"
+                   f"📊 New progress: {current_batch.processed}/{current_batch.total}\n"
+                   f"⏳ Remaining: {len(current_batch.remaining)}",
+        )
         
         await update.message.reply_text(f"▶️ Resumed processing from link {skip_count+1}")
 
     async def show_remain(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show remaining links when /remain command is sent."""
-        if not await self.is_admin(update):
-            return
-        
         # Don't check if batch is in progress - just send whatever is in current_batch
-        remain_count = len(current_batch['remaining'])
-        processed = current_batch['processed']
-        total = len(current_batch['all_links'])
+        remain_count = len(current_batch.remaining)
+        processed = current_batch.processed
+        total = current_batch.total
         
         if remain_count == 0:
             await update.message.reply_text("No remaining links to process.")
             return
         
-        # Create remain links file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        remain_file = TEMP_DIR / f"remain_links_{remain_count}_{timestamp}.txt"
-        with open(remain_file, 'w') as f:
-            f.write('\n'.join(current_batch['remaining']))
+        # Build remain links file in memory
+        remain_file = io.BytesIO('\n'.join(current_batch.remaining).encode())
         
         # Send the file immediately
-        with open(remain_file, 'rb') as f:
-            await update.message.reply_document(
-                document=InputFile(f),
-                caption=f"📊 Progress: {processed}/{total}\n"
-                       f"⏳ Remaining: {remain_count}\n"
-                       f"🔗 Last processed: {current_batch['last_processed_link'] if current_batch['last_processed_link'] else 'None'}",
-            )
-        
-        # Clean up
-        os.unlink(remain_file)
+        await update.message.reply_document(
+            document=InputFile(remain_file, filename=f"remain_links_{remain_count}_{next(_export_seq)}.txt"),
+            caption=f"📊 Progress: {processed}/{total}\n"
+                   f"⏳ Remaining: {remain_count}\n"
+                   f"🔗 Last processed: {current_batch.last_processed_link if current_batch.last_processed_link else 'None'}",
+        )
 
     async def pause_processing(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Pause current processing with /stopnow command."""
-        if not await self.is_admin(update):
-            return
-        
-        if not current_batch['is_processing']:
+        if not current_batch.remaining:
             await update.message.reply_text("No processing in progress to pause.")
             return
         
-        if current_batch['is_paused']:
+        if not self.pause_event.is_set():
             await update.message.reply_text("Processing is already paused.")
             return
         
-        current_batch['is_paused'] = True
-        await self.update_status_message(
-            context,
-            f"⏸️ Processing paused at {current_batch['processed']}/{len(current_batch['all_links'])}\n"
-            f"Last link: {current_batch['last_processed_link']}\n"
+        self.pause_event.clear()
+        self.schedule_status_update(
+            f"⏸️ Processing paused at {current_batch.processed}/{current_batch.total}\n"
+            f"Last link: {current_batch.last_processed_link}\n"
             f"Use /startnow to resume."
         )
         await update.message.reply_text("⏸️ Processing paused. Use /startnow to resume.")
 
     async def resume_processing(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Resume paused processing with /startnow command."""
-        if not await self.is_admin(update):
-            return
-        
-        if not current_batch['is_paused']:
+        if self.pause_event.is_set():
             await update.message.reply_text("Processing is not paused.")
             return
         
-        current_batch['is_paused'] = False
+        self.pause_event.set()
         
-        # Restart processing if it was stopped
-        if not current_batch['is_processing']:
-            current_batch['is_processing'] = True
-            self.processing_task = asyncio.create_task(self.process_batch(context))
-        
-        await self.update_status_message(
-            context,
+        self.schedule_status_update(
             f"▶️ Resuming processing...\n"
-            f"Current progress: {current_batch['processed']}/{len(current_batch['all_links'])}\n"
-            f"Next link: {current_batch['remaining'][0] if current_batch['remaining'] else 'None'}"
+            f"Current progress: {current_batch.processed}/{current_batch.total}\n"
+            f"Next link: {current_batch.remaining[0] if current_batch.remaining else 'None'}"
         )
         await update.message.reply_text("▶️ Processing resumed!")
 
     async def clear_queue(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Clear all queued links with /clean command."""
-        if not await self.is_admin(update):
-            return
-        
-        if not current_batch['remaining']:
+        if not current_batch.remaining:
+            if self._saved_links:
+                count, self._saved_links = self._saved_links, 0
+                await asyncio.to_thread(BATCH_LOG.unlink, missing_ok=True)
+                await update.message.reply_text(f"🧹 Discarded saved batch with {count} unfinished links.")
+                return
+            if current_batch.all_links:
+                # A finished batch still remembers its links, drop it so the next one starts fresh
+                current_batch.reset()
+                await asyncio.to_thread(BATCH_LOG.unlink, missing_ok=True)
+                await update.message.reply_text("🧹 Cleared the finished batch.")
+                return
             await update.message.reply_text("Queue is already empty.")
             return
         
-        # Cancel any ongoing processing
-        if self.processing_task and not self.processing_task.done():
-            self.processing_task.cancel()
-            try:
-                await self.processing_task
-            except asyncio.CancelledError:
-                pass
-        
-        count = len(current_batch['remaining'])
-        current_batch.update({
-            'all_links': [],
-            'processed': 0,
-            'failed': [],
-            'remaining': [],
-            'start_time': None,
-            'user_id': None,
-            'last_processed_link': None,
-            'is_processing': False,
-            'is_paused': False,
-            'status_message_id': None,
-            'last_auto_send': 0,
-            'caption_settings': {
-                'active': False,
-                'remaining': 0,
-                'text': None
-            }
-        })
+        # Cancel any ongoing processing before the batch goes away under it
+        await self._stop_workers()
+        count = len(current_batch.remaining)
+        current_batch.reset()
+        self.pause_event.set()
+        self._requeue_workers()
+        await asyncio.to_thread(BATCH_LOG.unlink, missing_ok=True)
         await update.message.reply_text(f"🧹 Cleared {count} links from queue.")
 
     async def send_remain_links(self, context: ContextTypes.DEFAULT_TYPE):
         """Send remaining links file to user automatically after every 5 links."""
-        if not current_batch['remaining'] or not current_batch['user_id']:
+        if not current_batch.remaining or not current_batch.user_id:
             return
         
-        remain_count = len(current_batch['remaining'])
-        processed = current_batch['processed']
-        total = len(current_batch['all_links'])
+        remain_count = len(current_batch.remaining)
+        processed = current_batch.processed
+        total = current_batch.total
         
         # Only send if we've processed at least 5 more links since last auto-send
-        if processed - current_batch['last_auto_send'] < 5:
+        if processed - current_batch.last_auto_send < 5:
             return
         
         # Update last auto-send counter
-        current_batch['last_auto_send'] = processed
+        current_batch.last_auto_send = processed
         
-        # Create remain links file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        remain_file = TEMP_DIR / f"remain_links_{remain_count}_{timestamp}.txt"
-        with open(remain_file, 'w') as f:
-            f.write('\n'.join(current_batch['remaining']))
-        
-        # Send the file
-        with open(remain_file, 'rb') as f:
-            await context.bot.send_document(
-                chat_id=current_batch['user_id'],
-                document=InputFile(f),
-                caption=f"📦 Automatic update after {processed % 5 if processed % 5 != 0 else 5} links processed\n"
-                       f"📊 Progress: {processed}/{total}\n"
-                       f"⏳ Remaining: {remain_count}\n"
-                       f"🔗 Last processed: {current_batch['last_processed_link']}",
-            )
+        # Build remain links file in memory
+        remain_file = io.BytesIO('\n'.join(current_batch.remaining).encode())
         
-        # Clean up
-        os.unlink(remain_file)
+        # Send the file, InputFile keeps the bytes so retries resend the same content
+        document = InputFile(remain_file, filename=f"remain_links_{remain_count}_{next(_export_seq)}.txt")
+        await self._tg_call(lambda: context.bot.send_document(
+            chat_id=current_batch.user_id,
+            document=document,
+            caption=f"📦 Automatic update after {processed % 5 if processed % 5 != 0 else 5} links processed\n"
+                   f"📊 Progress: {processed}/{total}\n"
+                   f"⏳ Remaining: {remain_count}\n"
+                   f"🔗 Last processed: {current_batch.last_processed_link}",
+        ), idempotent=False)
 
-    async def process_single_link(self, url: str, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Process a single video link and send to target group."""
+    async def process_single_link(self, url: str, context: ContextTypes.DEFAULT_TYPE, download: Awaitable[Optional[Path]]) -> bool:
+        """Wait for a single video link to download and send it to target group."""
         video_path = None
         error_msg = ""
+        current_batch.last_processed_link = url
+        # Every status of this link starts with the same lines, build them once
+        progress = (
+            f"### ⏳ Processing: {current_batch.processed + 1}/{current_batch.total}\n"
+            f"📎 Link: `{url}`\n"
+            f"📊 **Status Updates (Live):**\n"
+        )
         
         try:
-            current_batch['last_processed_link'] = url
-            processed = current_batch['processed'] + 1
-            total = len(current_batch['all_links'])
-            
             # Initial status update
-            await self.update_status_message(
-                context,
-                f"### ⏳ Processing: {processed}/{total}\n"
-                f"📎 Link: `{url}`\n"
-                f"📊 **Status Updates (Live):**\n"
-                f"- 🔽 Downloading..."
-            )
+            self.schedule_status_update(progress + "- 🔽 Downloading...")
             
-            # Download the video
-            video_path = await VideoDownloader.get_highest_quality_video(url)
+            # Wait for the download worker to finish the video
+            video_path = await download
             
             if not video_path or not video_path.exists():
                 if video_path is None:  # Specifically for size limit exceeded
                     error_msg = "Video exceeds 49MB limit"
-                    await self.update_status_message(
-                        context,
-                        f"### ⏳ Processing: {processed}/{total}\n"
-                        f"📎 Link: `{url}`\n"
-                        f"📊 **Status Updates (Live):**\n"
-                        f"- ⚠️ Error: {error_msg}"
-                    )
+                    self.schedule_status_update(progress + f"- ⚠️ Error: {error_msg}")
                 else:
                     error_msg = "Download failed"
-                    await self.update_status_message(
-                        context,
-                        f"### ⏳ Processing: {processed}/{total}\n"
-                        f"📎 Link: `{url}`\n"
-                        f"📊 **Status Updates (Live):**\n"
-                        f"- ⚠️ Error: {error_msg}"
-                    )
+                    self.schedule_status_update(progress + f"- ⚠️ Error: {error_msg}")
                 
-                current_batch['failed'].append(url)
+                current_batch.failed.append(url)
                 await self.send_completion_notification(context, url, False, error_msg)
                 return False
             
             # Update status - downloaded
-            await self.update_status_message(
-                context,
-                f"### ⏳ Processing: {processed}/{total}\n"
-                f"📎 Link: `{url}`\n"
-                f"📊 **Status Updates (Live):**\n"
-                f"- ✅ Downloaded\n"
-                f"- 🛠️ Preparing for upload"
+            self.schedule_status_update(
+                progress +
+                "- ✅ Downloaded\n"
+                "- 🛠️ Preparing for upload"
             )
             
             # Send the video to target group
-            with open(video_path, 'rb') as video_file:
-                await self.update_status_message(
-                    context,
-                    f"### ⏳ Processing: {processed}/{total}\n"
-                    f"📎 Link: `{url}`\n"
-                    f"📊 **Status Updates (Live):**\n"
-                    f"- ✅ Downloaded\n"
-                    f"- 📤 Uploading..."
-                )
+            self.schedule_status_update(
+                progress +
+                "- ✅ Downloaded\n"
+                "- 📤 Uploading..."
+            )
+            
+            # Handle caption settings
+            caption = None
+            if current_batch.caption_settings.active:
+                caption = current_batch.caption_settings.text
+                current_batch.caption_settings.remaining -= 1
                 
-                # Handle caption settings
-                caption = None
-                if current_batch['caption_settings']['active']:
-                    caption = current_batch['caption_settings']['text']
-                    current_batch['caption_settings']['remaining'] -= 1
-                    
-                    if current_batch['caption_settings']['remaining'] <= 0:
-                        current_batch['caption_settings']['active'] = False
-                        await context.bot.send_message(
-                            chat_id=current_batch['user_id'],
-                            text="ℹ️ Caption mode has been automatically disabled as the specified number of videos have been processed."
-                        )
-
-                await context.bot.send_video(
-                    chat_id=TARGET_GROUP_ID,
-                    video=video_file,
-                    supports_streaming=True,
-                    caption=caption,
-                    width=1280,
-                    height=720,
-                    write_timeout=120,
-                    read_timeout=120
-                )
+                if current_batch.caption_settings.remaining <= 0:
+                    current_batch.caption_settings.active = False
+                    await self._tg_call(lambda: context.bot.send_message(
+                        chat_id=current_batch.user_id,
+                        text="ℹ️ Caption mode has been automatically disabled as the specified number of videos have been processed."
+                    ))
+
+            await self._tg_call(lambda: context.bot.send_video(
+                chat_id=TARGET_GROUP_ID,
+                video=video_path,  # PTB opens the file itself, no extra handle held across status edits
+                supports_streaming=True,
+                caption=caption,
+                width=1280,
+                height=720,
+                write_timeout=120,
+                read_timeout=120
+            ), idempotent=False)
             
-            current_batch['processed'] += 1
+            current_batch.processed += 1
             await self.send_completion_notification(context, url, True)
             return True
             
         except Exception as e:
-            logger.error(f"Error processing video {url}: {e}")
+            logger.error("Error processing video %s: %s", url, e)
             error_msg = str(e)
-            await self.update_status_message(
-                context,
-                f"### ⏳ Processing: {processed}/{total}\n"
-                f"📎 Link: `{url}`\n"
-                f"📊 **Status Updates (Live):**\n"
-                f"- ⚠️ Error: {error_msg}"
-            )
-            current_batch['failed'].append(url)
+            self.schedule_status_update(progress + f"- ⚠️ Error: {error_msg}")
+            current_batch.failed.append(url)
             await self.send_completion_notification(context, url, False, error_msg)
             return False
         finally:
             # Clean up
-            if video_path and video_path.exists():
-                try:
-                    os.unlink(video_path)
-                except Exception as e:
-                    logger.error(f"Error deleting video file: {e}")
+            if video_path:
+                self._gc_q.put_nowait(video_path)
 
-    async def process_batch(self, context: ContextTypes.DEFAULT_TYPE):
-        """Process all links in the current batch."""
-        current_batch['is_processing'] = True
-        current_batch['start_time'] = datetime.now()
-        
-        try:
-            while current_batch['remaining']:
+    async def _feed_links(self):
+        """Hand queued links to the download and upload workers, in order."""
+        loop = asyncio.get_running_loop()
+        while True:
+            links = await self.link_q.get()
+            for url in links:
                 # Check for pause
-                while current_batch['is_paused']:
-                    await asyncio.sleep(1)
-                    continue
-                
-                # Check for cancellation
-                if not current_batch['is_processing']:
-                    break
+                await self.pause_event.wait()
                 
-                url = current_batch['remaining'][0]
-                if not (url.startswith('http://') or url.startswith('https://')):
-                    current_batch['remaining'].remove(url)
-                    continue
-                
-                success = await self.process_single_link(url, context)
-                current_batch['remaining'].remove(url)
-        
-            # Final report if processing wasn't cancelled
-            if current_batch['is_processing']:
-                elapsed = datetime.now() - current_batch['start_time']
-                await context.bot.send_message(
-                    chat_id=current_batch['user_id'],
-                    text=f"🎉 Batch processing completed!\n\n"
-                         f"✅ Success: {current_batch['processed']}\n"
-                         f"❌ Failed: {len(current_batch['failed'])}\n"
-                         f"⏱️ Time taken: {elapsed}"
-                )
-        except asyncio.CancelledError:
-            logger.info("Batch processing was cancelled")
-        except Exception as e:
-            logger.error(f"Error during batch processing: {e}")
-            await context.bot.send_message(
-                chat_id=current_batch['user_id'],
-                text=f"❌ Error during batch processing: {e}"
-            )
-        finally:
-            current_batch['is_processing'] = False
-            current_batch['status_message_id'] = None
+                download = loop.create_future()
+                self._dispatched[url] = download
+                video_path = self._prefetched.pop(url, None)
+                if video_path:
+                    # Downloaded before the workers were restarted, no need to fetch it again
+                    download.set_result(video_path)
+                else:
+                    await self._download_q.put((url, download))
+                await self._upload_q.put((url, download))
+
+    async def _download_worker(self):
+        """Download links handed over by the feeder on whichever downloader is idle."""
+        while True:
+            url, download = await self._download_q.get()
+            # Take the downloader before the slot, so a worker waiting for one holds no slot
+            downloader = await self._idle_downloaders.get()
+            try:
+                await self.dl_sem.acquire()
+            except asyncio.CancelledError:
+                self._idle_downloaders.put_nowait(downloader)
+                raise
+            # The yt-dlp thread outlives a cancelled worker, it keeps its slot until it's done
+            job = asyncio.ensure_future(downloader.get_highest_quality_video(url))
+            job.add_done_callback(functools.partial(self._download_done, downloader))
+            try:
+                video_path = await asyncio.shield(job)
+            except asyncio.CancelledError:
+                job.add_done_callback(self._discard_download)
+                raise
+            if not download.cancelled():
+                download.set_result(video_path)
+
+    def _download_done(self, downloader: VideoDownloader, job: asyncio.Future) -> None:
+        self.dl_sem.release()
+        self._idle_downloaders.put_nowait(downloader)
+
+    def _discard_download(self, job: asyncio.Future) -> None:
+        """Delete the video of a download whose link was dropped while it ran."""
+        if not job.cancelled() and job.result():
+            self._gc_q.put_nowait(job.result())
+
+    async def _upload_worker(self, context: ContextTypes.DEFAULT_TYPE):
+        """Send downloaded videos one at a time, in the order the links were queued."""
+        while True:
+            url, download = await self._upload_q.get()
+            
+            # Hold back uploads while paused, downloads already running just wait here
+            await self.pause_event.wait()
+            self._dispatched.pop(url, None)
+            
+            try:
+                success = await self.process_single_link(url, context, download)
+                # Pop before the next await so a cancelled worker can't leave a sent link queued
+                current_batch.remaining.popleft()  # Uploads finish in queue order
+                finished = not current_batch.remaining
+                if not success:
+                    current_batch.seen_links.pop(url, None)  # Sending a failed link again retries it
+                async with self.batch_lock:
+                    await self.log_links('done' if success else 'failed', [url])
+                if finished:
+                    await self._finish_batch(context)
+            except Exception as e:
+                logger.error("Error during batch processing: %s", e)
+
+    async def _finish_batch(self, context: ContextTypes.DEFAULT_TYPE):
+        """Send the final report once the last queued link is done."""
+        current_batch.status_message_id = None
+        elapsed = datetime.now() - current_batch.start_time
+        await self._tg_call(lambda: context.bot.send_message(
+            chat_id=current_batch.user_id,
+            text=f"🎉 Batch processing completed!\n\n"
+                 f"✅ Success: {current_batch.processed}\n"
+                 f"❌ Failed: {len(current_batch.failed)}\n"
+                 f"⏱️ Time taken: {elapsed}"
+        ))
+
+    def _start_workers(self, context: ContextTypes.DEFAULT_TYPE):
+        """Start the long-lived workers that drain link_q."""
+        self._context = context
+        self._download_q = asyncio.Queue(maxsize=PREFETCH_LIMIT)
+        self._upload_q = asyncio.Queue(maxsize=PREFETCH_LIMIT)
+        self._workers = [
+            asyncio.create_task(self._feed_links()),
+            asyncio.create_task(self._upload_worker(context)),
+            asyncio.create_task(self._status_writer(context)),
+        ]
+        self._workers.extend(
+            asyncio.create_task(self._download_worker())
+            for _ in self.downloaders
+        )
+
+    async def _stop_workers(self):
+        """Cancel the workers, dropping the links they were working on."""
+        if not self._workers:
+            return
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        
+        # Keep videos that were downloaded but not uploaded, _requeue_workers reuses or deletes them
+        for url, download in self._dispatched.items():
+            if download.done() and not download.cancelled() and download.result():
+                self._prefetched[url] = download.result()
+        self._dispatched.clear()
+        current_batch.status_message_id = None
+
+    def _requeue_workers(self):
+        """Start stopped workers again on current_batch.remaining, from the start."""
+        while not self.link_q.empty():
+            self.link_q.get_nowait()
+        
+        # Downloads of links that were skipped or cleared meanwhile aren't needed anymore
+        keep = set(current_batch.remaining)
+        for url in [url for url in self._prefetched if url not in keep]:
+            self._gc_q.put_nowait(self._prefetched.pop(url))
+        if current_batch.remaining:
+            self._enqueue(list(current_batch.remaining))
+        self._start_workers(self._context)
+
+    def _enqueue(self, links: List[str]):
+        """Queue links for the workers as one item, never blocks so handlers return right away."""
+        self.link_q.put_nowait(links)
 
     async def add_links_to_queue(self, links: List[str], update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Add new links to the processing queue."""
-        # Initialize batch if empty
-        if not current_batch['all_links']:
-            current_batch.update({
-                'all_links': links,
-                'processed': 0,
-                'failed': [],
-                'remaining': links.copy(),
-                'user_id': update.effective_user.id,
-                'last_processed_link': None,
-                'is_processing': True,
-                'is_paused': False,
-                'status_message_id': None,
-                'last_auto_send': 0,
-                'caption_settings': {
-                    'active': False,
-                    'remaining': 0,
-                    'text': None
-                }
-            })
-            
-            # Start processing if not already running
-            if not self.processing_task or self.processing_task.done():
-                self.processing_task = asyncio.create_task(self.process_batch(context))
+        # Starting a new batch would overwrite the batch log /resume restores from
+        if self._saved_links and not current_batch.all_links:
+            await update.message.reply_text(
+                f"⚠️ A saved batch with {self._saved_links} unfinished links exists.\n"
+                f"Use /resume to continue it or /clean to discard it, then send the links again."
+            )
+            return
+        
+        # Validate and dedupe once here so the processing loop doesn't have to
+        seen = current_batch.seen_links
+        new_links = []
+        for url in links:
+            if not _URL_OK(url):
+                continue
+            if url in seen:
+                seen.move_to_end(url)
+                continue
+            seen[url] = None
+            new_links.append(url)
+        while len(seen) > SEEN_LINKS_LIMIT:
+            seen.popitem(last=False)
+        links = new_links
+        
+        if not links:
+            await update.message.reply_text("No new links to add (duplicates and invalid links are skipped).")
+            return
+        
+        # Update the batch and hand all links to the workers in one go
+        async with self.batch_lock:
+            new_batch = not current_batch.all_links
+            if new_batch:
+                current_batch.reset(
+                    all_links=links,
+                    total=len(links),
+                    remaining=deque(links),
+                    seen_links=seen,
+                    user_id=update.effective_user.id,
+                    start_time=datetime.now(),
+                )
+                self.pause_event.set()
+            else:
+                # Add new links to existing queue, restarting the clock if the last batch was done
+                if not current_batch.remaining:
+                    current_batch.start_time = datetime.now()
+                current_batch.all_links.extend(links)
+                current_batch.total += len(links)
+                current_batch.remaining.extend(links)
             
+            # Downloads start while the batch log is written, the upload worker
+            # needs batch_lock to log a result so it can't get ahead of these rows
+            self._enqueue(links)
+            if new_batch:
+                await asyncio.to_thread(BATCH_LOG.unlink, missing_ok=True)
+            await self.log_links('queued', links)
+        
+        if new_batch:
             await update.message.reply_text(
                 f"📦 Starting batch processing of {len(links)} links...\n"
                 f"First link will be processed shortly.\n"
                 f"Use /remain to check progress or /clean to stop."
             )
         else:
-            # Add new links to existing queue
-            current_batch['all_links'].extend(links)
-            current_batch['remaining'].extend(links)
-            
-            total_links = len(current_batch['all_links'])
+            total_links = current_batch.total
             new_links_count = len(links)
             
             await update.message.reply_text(
                 f"➕ {new_links_count} links added successfully!\n"
                 f"📊 Total in queue: {total_links}\n"
-                f"⏳ Currently processing: {current_batch['processed'] + 1}/{total_links}"
+                f"⏳ Currently processing: {current_batch.processed + 1}/{total_links}"
             )
-            
-            # Restart processing if it was completed
-            if not current_batch['is_processing'] and current_batch['remaining']:
-                current_batch['is_processing'] = True
-                self.processing_task = asyncio.create_task(self.process_batch(context))
 
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle incoming messages containing URLs or text files."""
-        if not await self.is_admin(update):
+    async def resume_batch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Restore the batch saved in the batch log with /resume command."""
+        if current_batch.remaining:
+            await update.message.reply_text("A batch is already queued. Use /clean first to drop it.")
             return
         
+        rows = await asyncio.to_thread(self._read_batch_log)
+        queued = [row['url'] for row in rows if row['status'] == 'queued']
+        finished = {row['url']: row['status'] for row in rows if row['status'] != 'queued'}
+        remaining = [url for url in queued if url not in finished]
+        if not remaining:
+            await update.message.reply_text("No saved batch to resume.")
+            return
+        
+        failed = [url for url, status in finished.items() if status == 'failed']
+        processed = len(finished) - len(failed)
+        self._saved_links = 0
+        async with self.batch_lock:
+            current_batch.reset(
+                all_links=queued,
+                total=len(queued),
+                processed=processed,
+                failed=failed,
+                remaining=deque(remaining),
+                seen_links=OrderedDict.fromkeys(queued[-SEEN_LINKS_LIMIT:]),
+                user_id=update.effective_user.id,
+                start_time=datetime.now(),
+                last_auto_send=processed,
+            )
+            self.pause_event.set()
+            self._enqueue(remaining)
+        
+        await update.message.reply_text(
+            f"♻️ Resumed saved batch!\n"
+            f"📊 Progress: {processed}/{current_batch.total}\n"
+            f"⏳ Remaining: {len(remaining)}"
+        )
+
+    @staticmethod
+    def _parse_links(data: bytes) -> List[str]:
+        return [line.strip() for line in data.decode('utf-8', 'replace').splitlines() if line.strip()]
+
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle incoming messages containing URLs or text files."""
         message = update.message
         
         # Handle text file with multiple links
         if message.document and message.document.mime_type == 'text/plain':
             try:
-                # Download the text file
+                # Download the text file into memory, link lists are small and Telegram caps bot downloads at 20MB
                 file = await message.document.get_file()
-                temp_file = TEMP_DIR / "links.txt"
-                await file.download_to_drive(temp_file)
+                buffer = io.BytesIO()
+                await file.download_to_memory(out=buffer)
                 
                 # Read links from file
-                with open(temp_file, 'r') as f:
-                    links = [line.strip() for line in f.readlines() if line.strip()]
+                links = await asyncio.to_thread(self._parse_links, buffer.getvalue())
                 
                 # Add links to queue
                 await self.add_links_to_queue(links, update, context)
                 
-                # Clean up
-                os.unlink(temp_file)
-                
             except Exception as e:
-                logger.error(f"Error processing text file: {e}")
+                logger.error("Error processing text file: %s", e)
                 await message.reply_text(f"❌ Error processing text file: {e}")
         
         # Handle single link
-        elif message.text and (message.text.startswith('http://') or message.text.startswith('https://')):
+        elif message.text and _URL_OK(message.text):
             url = message.text.strip()
             await self.add_links_to_queue([url], update, context)
 
+    @staticmethod
+    def _append_batch_log(rows: List[Dict]) -> None:
+        with open(BATCH_LOG, 'a') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+
+    @staticmethod
+    def _read_batch_log() -> List[Dict]:
+        rows = []
+        try:
+            with open(BATCH_LOG, 'r') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Last line cut short by a crash
+                    # Read at startup too, a stray row must not keep the bot from starting
+                    if isinstance(row, dict) and 'url' in row and 'status' in row:
+                        rows.append(row)
+        except FileNotFoundError:
+            pass
+        return rows
+
+    async def log_links(self, status: str, urls: List[str]) -> None:
+        """Append the links' new status to the batch log so /resume can pick up after a restart."""
+        ts = datetime.now().isoformat(timespec='seconds')
+        rows = [{'url': url, 'status': status, 'ts': ts} for url in urls]
+        try:
+            await asyncio.to_thread(self._append_batch_log, rows)
+        except OSError as e:
+            logger.error("Error writing batch log: %s", e)
+
+    @staticmethod
+    def _delete_files(paths: List[Path]) -> None:
+        """Delete the given files, ignoring ones that are already gone."""
+        for path in paths:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.error("Error deleting video file: %s", e)
+
+    @staticmethod
+    def _sweep_temp_dir() -> None:
+        """Delete files a crashed run left in TEMP_DIR, only safe before the workers start."""
+        for path in TEMP_DIR.glob('*'):
+            if path == BATCH_LOG:
+                continue
+            try:
+                if path.is_file():
+                    path.unlink()
+            except OSError as e:
+                logger.warning("Couldn't remove leftover file %s: %s", path, e)
+
+    async def _janitor(self):
+        """Delete finished video files in batches, off the event loop."""
+        while True:
+            paths = [await self._gc_q.get()]
+            
+            # Take everything queued meanwhile so one thread hop deletes them all
+            while not self._gc_q.empty():
+                paths.append(self._gc_q.get_nowait())
+            await asyncio.to_thread(self._delete_files, paths)
+
+    async def _post_init(self, application: Application) -> None:
+        # Nothing is downloading yet, so whatever is in TEMP_DIR besides the batch log is left over
+        await asyncio.to_thread(self._sweep_temp_dir)
+        rows = await asyncio.to_thread(self._read_batch_log)
+        finished = {row['url'] for row in rows if row['status'] != 'queued'}
+        self._saved_links = sum(1 for row in rows if row['status'] == 'queued' and row['url'] not in finished)
+        if self._saved_links:
+            logger.info("Batch log has %s unfinished links, send /resume to continue", self._saved_links)
+        self._janitor_task = asyncio.create_task(self._janitor())
+        self._start_workers(CallbackContext(application))
+
+    async def _post_stop(self, application: Application) -> None:
+        if self._janitor_task:
+            self._janitor_task.cancel()
+        await self._stop_workers()
+
     def run(self, use_webhook: bool = False):
         """Run the bot."""
         if use_webhook:
-            # Webhook configuration would go here
-            pass
+            # Telegram pushes updates to us, run_webhook also handles SIGINT/SIGTERM
+            self.application.run_webhook(
+                listen="0.0.0.0",
+                port=int(os.environ["PORT"]),
+                url_path=TOKEN,
+                webhook_url=f"{PUBLIC_URL}/{TOKEN}",
+                secret_token=os.environ.get("TG_SECRET"),
+            )
         else:
             self.application.run_polling()
 
 if __name__ == "__main__":
     bot = TelegramBot(TOKEN)
-    bot.run()
+    bot.run(use_webhook=bool(PUBLIC_URL))